@@ -1,18 +1,55 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, send_file
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room
+from sqlalchemy import func, inspect, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.sqlite import insert
+from collections import OrderedDict
+from datetime import datetime, timezone
 import json
+import orjson
+import os
 import re
+import threading
+import time
+
+from image_cache import ImageCache
 
 
 app = Flask(__name__)
 
 app.config['SECRET_KEY'] = 'secret'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///users.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///users.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['STATS_RECONCILE_INTERVAL'] = 300  # Период пересчёта счётчиков статистики, сек
+app.config['STATS_TOP_LIMIT'] = 10  # Размер топов книг и авторов в /stats
+app.config['ASYNC_POOL_SIZE'] = 10  # Постоянные соединения aiosqlite в async_app.py
+app.config['ASYNC_MAX_OVERFLOW'] = 10  # Дополнительные соединения aiosqlite под нагрузкой
+app.config['IDEMPOTENCY_TTL'] = 600  # Время хранения ответов по Idempotency-Key, сек
+app.config['IDEMPOTENCY_MAX_KEYS'] = 10000  # Максимум хранимых Idempotency-Key
+app.config['IMAGE_PROXY_ENABLED'] = False  # Отдавать обложки через /book_cover с локальным кэшем
+app.config['IMAGE_CACHE_DIR'] = os.path.join(app.instance_path, 'image_cache')
+app.config['IMAGE_CACHE_MAX_BYTES'] = 200 * 1024 * 1024  # Максимальный размер кэша обложек на диске
+app.config['IMAGE_MAX_FILE_BYTES'] = 5 * 1024 * 1024  # Максимальный размер одной обложки
+app.config['IMAGE_CACHE_REVALIDATE'] = 24 * 60 * 60  # Через сколько секунд перепроверять обложку у источника
+app.config['IMAGE_FETCH_TIMEOUT'] = 10  # Таймаут загрузки обложки, сек
 db = SQLAlchemy(app)
-socketio = SocketIO(app)
+
+
+# JSON-модуль Socket.IO на orjson: пакеты событий (в том числе request_update) кодируются
+# тем же быстрым кодировщиком, что и списковые ответы. python-socketio ожидает str от dumps
+class OrjsonSocketJSON:
+    @staticmethod
+    def dumps(obj, *args, **kwargs):
+        return orjson.dumps(obj).decode('utf-8')
+
+    @staticmethod
+    def loads(data, *args, **kwargs):
+        return orjson.loads(data)
+
+
+socketio = SocketIO(app, json=OrjsonSocketJSON)
 
 # Модель пользователя
 class User(db.Model):
@@ -34,10 +71,19 @@ class Request(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # Связь с пользователем
     book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=False)  # Связь с книгой
     status = db.Column(db.Boolean, nullable=True)  # Статус заявки (True/False/None)
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))  # Время создания заявки
 
     user = db.relationship('User', backref='requests_made')  # Обратная связь с пользователем
     book = db.relationship('Book', backref='requests_received')  # Обратная связь с книгой
 
+    # Очередь ожидания книги: индекс только по ожидающим заявкам (status IS NULL)
+    # Не более одной ожидающей заявки пользователя на книгу
+    __table_args__ = (
+        db.Index('ix_request_waitlist', 'book_id', 'created_at', sqlite_where=db.text('status IS NULL')),
+        db.Index('uq_request_pending', 'user_id', 'book_id', unique=True, sqlite_where=db.text('status IS NULL')),
+        db.Index('ix_request_holder', 'book_id', sqlite_where=db.text('status = 1')),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -88,6 +134,222 @@ class BookReturn(db.Model):
             'is_returned': self.is_returned
         }
 
+# Модель счётчика статистики (scope - вид счётчика, key - книга/автор/пользователь)
+class StatCounter(db.Model):
+    scope = db.Column(db.String(32), primary_key=True)
+    key = db.Column(db.String(200), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+    # Топы и ненулевые значения по виду счётчика без чтения всей таблицы
+    __table_args__ = (
+        db.Index('ix_stat_counter_scope_value', 'scope', 'value'),
+    )
+
+
+# Кэш ответов по Idempotency-Key с ограниченным размером и временем жизни
+class IdempotencyCache:
+    def __init__(self, max_keys, ttl):
+        self.max_keys = max_keys
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, response = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            return response
+
+    def set(self, key, response):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, response)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_keys:
+                self.entries.popitem(last=False)
+
+
+idempotency_cache = IdempotencyCache(app.config['IDEMPOTENCY_MAX_KEYS'], app.config['IDEMPOTENCY_TTL'])
+
+
+# Сериализация строк column-only запросов в JSON без создания ORM-объектов
+class RowSerializer:
+    def __init__(self, *columns):
+        self.columns = columns
+        self.keys = tuple(column.key for column in columns)
+
+    def select(self):
+        return select(*self.columns)
+
+    def fetch(self, *criteria):
+        return db.session.execute(self.select().where(*criteria)).all()
+
+    def dicts(self, rows):
+        keys = self.keys
+        return [dict(zip(keys, row)) for row in rows]
+
+    def encode(self, rows):
+        # orjson сам кэширует закодированные ключи, поэтому словари из кортежей дешевле ручной сборки
+        return orjson.dumps(self.dicts(rows))
+
+    def response(self, rows, status=200):
+        return app.response_class(self.encode(rows), status=status, mimetype='application/json')
+
+
+USER_ROWS = RowSerializer(User.id, User.username, User.requests)
+BOOK_ROWS = RowSerializer(Book.id, Book.title, Book.author, Book.image_url, Book.holders, Book.isFree, Book.request_status)
+REQUEST_ROWS = RowSerializer(Request.id, Request.user_id, Request.book_id, Request.status)
+RETURN_ROWS = RowSerializer(BookReturn.id, BookReturn.request_id, BookReturn.user_id, BookReturn.book_id, BookReturn.is_returned)
+USER_REQUEST_ROWS = RowSerializer(Book.title.label('book_title'), Request.status, Request.id, Request.book_id)
+
+
+# Изменение счётчика статистики в текущей транзакции
+def bump_stat(scope, key, delta=1):
+    stmt = insert(StatCounter).values(scope=scope, key=str(key), value=delta)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[StatCounter.scope, StatCounter.key],
+        set_={'value': StatCounter.value + delta}
+    )
+    db.session.execute(stmt)
+
+
+# Ненулевые счётчики одного вида (индекс ix_stat_counter_scope_value)
+def stat_values(scope):
+    rows = db.session.query(StatCounter.key, StatCounter.value) \
+        .filter(StatCounter.scope == scope, StatCounter.value > 0)
+    return {key: value for key, value in rows}
+
+
+# Первые limit счётчиков одного вида по убыванию значения
+def stat_top(scope, limit):
+    return db.session.query(StatCounter.key, StatCounter.value) \
+        .filter(StatCounter.scope == scope, StatCounter.value > 0) \
+        .order_by(StatCounter.value.desc(), StatCounter.key).limit(limit).all()
+
+
+# Пересчёт всех счётчиков статистики по таблицам (исправляет расхождения)
+def reconcile_stats():
+    db.session.query(StatCounter).delete()
+
+    counters = {}
+    for is_free, count in db.session.query(Book.isFree, func.count(Book.id)).group_by(Book.isFree):
+        counters[('library', 'free' if is_free else 'loaned')] = count
+    for book_id, count in db.session.query(Request.book_id, func.count(Request.id)) \
+            .filter(Request.status.is_(None)).group_by(Request.book_id):
+        counters[('book_pending', str(book_id))] = count
+    for book_id, count in db.session.query(Request.book_id, func.count(Request.id)).group_by(Request.book_id):
+        counters[('book_requests', str(book_id))] = count
+    for author, count in db.session.query(Book.author, func.count(Request.id)) \
+            .join(Request, Request.book_id == Book.id).group_by(Book.author):
+        counters[('author_requests', author)] = count
+    for user_id, count in db.session.query(Request.user_id, func.count(Request.id)) \
+            .filter(Request.status.is_(True)).group_by(Request.user_id):
+        counters[('user_loans', str(user_id))] = count
+
+    db.session.add_all(
+        StatCounter(scope=scope, key=key, value=value)
+        for (scope, key), value in counters.items()
+    )
+    db.session.commit()
+
+
+# Следующая заявка в очереди ожидания книги
+def next_in_line(book_id):
+    return Request.query.filter(Request.book_id == book_id, Request.status.is_(None)) \
+        .order_by(Request.created_at, Request.id).first()
+
+
+# Позиция заявки в очереди ожидания книги (начиная с 1)
+def waitlist_position(request_entry):
+    ahead = Request.query.filter(
+        Request.book_id == request_entry.book_id,
+        Request.status.is_(None),
+        db.or_(
+            Request.created_at < request_entry.created_at,
+            db.and_(Request.created_at == request_entry.created_at, Request.id < request_entry.id)
+        )
+    ).count()
+    return ahead + 1
+
+
+# Одобренная заявка, по которой книга сейчас на руках
+def current_holder(book_id):
+    return Request.query.filter(Request.book_id == book_id, Request.status == True).first()
+
+
+# Выдача освободившейся книги следующему в очереди (в текущей транзакции)
+def promote_next_in_line(book):
+    next_request = next_in_line(book.id)
+    if not next_request:
+        return None
+
+    next_request.status = True
+    book.isFree = False
+    bump_stat('book_pending', book.id, -1)
+    bump_stat('user_loans', next_request.user_id, 1)
+    bump_stat('library', 'free', -1)
+    bump_stat('library', 'loaned', 1)
+    return next_request
+
+
+# Уведомление о выдаче книги: только владельцу заявки и администраторам
+def notify_promotion(request_entry):
+    payload = request_entry.to_dict()
+    socketio.emit('request_promoted', payload, to=f'user_{request_entry.user_id}')
+    socketio.emit('request_promoted', payload, to='admins')
+
+
+# Прогрев кэша обложек по таблице Book
+def prefetch_images(cache):
+    with app.app_context():
+        urls = db.session.execute(
+            select(Book.image_url).where(Book.image_url.isnot(None)).distinct()
+        ).scalars().all()
+    for url in urls:
+        try:
+            cache.get(url)
+        except (OSError, ValueError):
+            continue
+
+
+image_cache_lock = threading.Lock()
+
+
+# Кэш обложек создаётся при первом использовании по текущим настройкам и сразу запускает прогрев
+def get_image_cache():
+    cache = app.extensions.get('image_cache')
+    if cache is None:
+        with image_cache_lock:
+            cache = app.extensions.get('image_cache')
+            if cache is None:
+                cache = ImageCache(
+                    app.config['IMAGE_CACHE_DIR'],
+                    app.config['IMAGE_CACHE_MAX_BYTES'],
+                    app.config['IMAGE_MAX_FILE_BYTES'],
+                    app.config['IMAGE_CACHE_REVALIDATE'],
+                    app.config['IMAGE_FETCH_TIMEOUT']
+                )
+                app.extensions['image_cache'] = cache
+                socketio.start_background_task(prefetch_images, cache)
+    return cache
+
+
+# Фоновая задача периодического пересчёта статистики
+def stats_reconcile_job():
+    while True:
+        socketio.sleep(app.config['STATS_RECONCILE_INTERVAL'])
+        with app.app_context():
+            try:
+                reconcile_stats()
+            except Exception:
+                # Ошибка одного пересчёта (например, "database is locked") не должна останавливать задачу
+                db.session.rollback()
+                app.logger.exception('Stats reconcile failed')
+
 
 
 # Инициализация администратора
@@ -117,20 +379,54 @@ def load_books_from_json(file_path):
             )
             db.session.add(book)
         db.session.commit()
+    reconcile_stats()
 
 
-# Инициализация базы данных
-with app.app_context():
-    db.create_all()
-    init_admin_user()
+# Добавление недостающих колонок и индексов в базу, созданную предыдущей версией
+# (db.create_all() не изменяет уже существующие таблицы)
+def migrate_db():
+    columns = {column['name'] for column in inspect(db.engine).get_columns('request')}
+    if 'created_at' not in columns:
+        db.session.execute(db.text('ALTER TABLE request ADD COLUMN created_at DATETIME'))
+        # Старые заявки встают в очередь раньше новых, между собой - по id
+        db.session.execute(db.text("UPDATE request SET created_at = '1970-01-01 00:00:00.000000'"))
+        db.session.commit()
 
-    # Проверка на пустоту таблицы 'Book'
-    if Book.query.count() == 0:  # Если в таблице нет записей
-        load_books_from_json('books.json')
-        print("Данные из 'books.json' загружены в таблицу 'Book'.")
-    else:
-        print("Таблица 'Book' уже заполнена, данные из JSON не загружаются.")
+    # Перед созданием uq_request_pending отклоняем повторные ожидающие заявки
+    # на ту же книгу от того же пользователя, оставляя самую раннюю
+    if not any(index['name'] == 'uq_request_pending' for index in inspect(db.engine).get_indexes('request')):
+        db.session.execute(db.text(
+            'UPDATE request SET status = 0 WHERE status IS NULL AND id NOT IN ('
+            'SELECT MIN(id) FROM request WHERE status IS NULL GROUP BY user_id, book_id)'
+        ))
+        db.session.commit()
 
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+
+# Инициализация базы данных (вызывается явно при запуске сервера, импорт модуля базу не трогает)
+def init_db():
+    with app.app_context():
+        db.create_all()
+        migrate_db()
+        init_admin_user()
+
+        # Проверка на пустоту таблицы 'Book'
+        if Book.query.count() == 0:  # Если в таблице нет записей
+            load_books_from_json('books.json')
+            print("Данные из 'books.json' загружены в таблицу 'Book'.")
+        else:
+            print("Таблица 'Book' уже заполнена, данные из JSON не загружаются.")
+            reconcile_stats()
+
+
+# Запуск фоновых задач (вызывается при старте сервера, а не при импорте модуля)
+def start_background_jobs():
+    socketio.start_background_task(stats_reconcile_job)
+    if app.config['IMAGE_PROXY_ENABLED']:
+        get_image_cache()
 
 
 # Эндпоинт: проверка пользователя
@@ -180,15 +476,13 @@ def add_user():
 # Эндпоинт: получение списка всех пользователей
 @app.route('/users', methods=['GET'])
 def get_users():
-    users = User.query.all()
-    return jsonify([user.to_dict() for user in users]), 200
+    return USER_ROWS.response(USER_ROWS.fetch())
 
 
 # Эндпоинт: получение списка всех книг
 @app.route('/books', methods=['GET'])
 def get_books():
-    books = Book.query.all()
-    return jsonify([book.to_dict() for book in books]), 200
+    return BOOK_ROWS.response(BOOK_ROWS.fetch())
 
 
 
@@ -217,9 +511,20 @@ def get_book_requests(book_id):
 @app.route('/requests', methods=['GET'])
 def get_requests():
     # This will send all current requests as an initial load.
-    requests = Request.query.all()
-    requests_data = [{'id': req.id, 'status': req.status, 'book_id': req.book_id, 'user_id': req.user_id} for req in requests]
-    return jsonify(requests_data)
+    return REQUEST_ROWS.response(REQUEST_ROWS.fetch())
+
+# Подключение клиента: личные уведомления (и уведомления администраторов)
+# только после проверки логина и пароля, переданных в auth при подключении
+@socketio.on('connect')
+def handle_connect(auth=None):
+    if not auth:
+        return  # Анонимный клиент получает только общие события
+    user = User.query.filter_by(username=auth.get('username')).first()
+    if not user or not check_password_hash(user.password, auth.get('password') or ''):
+        return False  # Отклоняем подключение с неверными данными
+    join_room(f'user_{user.id}')
+    if user.username == 'admin':
+        join_room('admins')
 
 # @socketio.on('subscribe_requests')
 # def handle_requests_subscription():
@@ -235,19 +540,49 @@ def create_request():
     data = request.get_json()
     user_id = data.get('userId')
     book_id = data.get('bookId')
+
+    # Повтор запроса с тем же Idempotency-Key получает исходный ответ без записи в базу
+    idempotency_key = request.headers.get('Idempotency-Key')
+    cache_key = (idempotency_key, user_id, book_id) if idempotency_key else None
+    if cache_key:
+        cached = idempotency_cache.get(cache_key)
+        if cached:
+            body, status = cached
+            return jsonify(body), status
+
     user = User.query.get(user_id)
     book = Book.query.get(book_id)
     if not user or not book:
         return jsonify({'message': 'User or book not found'}), 404
     new_request = Request(user_id=user_id, book_id=book_id, status=None)
     db.session.add(new_request)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        # Ожидающая заявка на эту книгу уже есть (уникальный индекс uq_request_pending)
+        db.session.rollback()
+        existing = Request.query.filter(
+            Request.user_id == user_id, Request.book_id == book_id, Request.status.is_(None)
+        ).first()
+        if not existing:
+            # Конфликтующую заявку успели одобрить или отклонить - клиент может повторить запрос
+            return jsonify({'message': 'Request state changed, please retry'}), 409
+        body, status = {'message': 'Request already exists', 'request_id': existing.id}, 200
+        if cache_key:
+            idempotency_cache.set(cache_key, (body, status))
+        return jsonify(body), status
+
+    bump_stat('book_pending', book.id)
+    bump_stat('book_requests', book.id)
+    bump_stat('author_requests', book.author)
+    user.requests = (user.requests or []) + [new_request.id]
     db.session.commit()
-    if user.requests is None:
-        user.requests = []
-    user.requests.append(new_request.id)
-    db.session.commit()
-    socketio.emit('request_update', [req.to_dict() for req in Request.query.all()])
-    return jsonify({'message': 'Request created successfully'}), 201
+
+    body, status = {'message': 'Request created successfully', 'request_id': new_request.id}, 201
+    if cache_key:
+        idempotency_cache.set(cache_key, (body, status))
+    socketio.emit('request_update', REQUEST_ROWS.dicts(REQUEST_ROWS.fetch()))
+    return jsonify(body), status
 # Эндпоинт: получить название книги по id
 @app.route('/book_title/<int:book_id>', methods=['GET'])
 def get_book_title(book_id):
@@ -302,15 +637,31 @@ def update_request_status():
     if not book_entry:
         return jsonify({'message': 'Book not found'}), 404
 
+    old_status = request_entry.status
+
     if status:  # Если статус заявки становится True
         if not book_entry.isFree:  # Если книга уже занята
-            return jsonify({'message': 'The book is already taken'}), 400
+            # Заявка остаётся ожидающей и стоит в очереди на книгу
+            response = {'message': 'The book is already taken'}
+            if old_status is None:
+                response['waitlist_position'] = waitlist_position(request_entry)
+            return jsonify(response), 400
         # Обновляем статус заявки и книги
         request_entry.status = True
         book_entry.isFree = False
+        bump_stat('library', 'free', -1)
+        bump_stat('library', 'loaned', 1)
     else:  # Если статус заявки становится False
         request_entry.status = False
 
+    # Обновляем счётчики статистики
+    if old_status is None:
+        bump_stat('book_pending', book_entry.id, -1)
+    if old_status is not True and request_entry.status is True:
+        bump_stat('user_loans', request_entry.user_id, 1)
+    elif old_status is True and request_entry.status is not True:
+        bump_stat('user_loans', request_entry.user_id, -1)
+
     # Сохраняем изменения в базе данных
     db.session.commit()
 
@@ -329,23 +680,18 @@ def get_user_requests_by_id(user_id):
     if not user:
         return jsonify({'message': 'User not found'}), 404
 
-    # Формируем список заявок пользователя
-    user_requests = [
-        {
-            'book_title': request.book.title if request.book else None,  # Название книги
-            'status': request.status , # Статус заявки
-            'id' : request.id,
-            'book_id': request.book_id
-        }
-        for request in user.requests_made  # Обход всех заявок пользователя
-    ]
+    # Формируем список заявок пользователя (название книги, статус, id заявки, id книги)
+    user_requests = db.session.execute(
+        USER_REQUEST_ROWS.select()
+        .outerjoin(Book, Book.id == Request.book_id)
+        .where(Request.user_id == user_id)
+    ).all()
 
-    return jsonify(user_requests), 200
+    return USER_REQUEST_ROWS.response(user_requests)
 
 @app.route('/returns', methods=['GET'])
 def get_returns():
-    returns = BookReturn.query.all()
-    return jsonify([return_record.to_dict() for return_record in returns]), 200
+    return RETURN_ROWS.response(RETURN_ROWS.fetch())
 
 @app.route('/return_book', methods=['POST'])
 def return_book():
@@ -374,6 +720,10 @@ def return_book():
     if req.user_id != user_id:
         return jsonify({'message': 'This request does not belong to the user'}), 403
 
+    # Проверяем, что заявка относится к указанной книге
+    if req.book_id != book_id:
+        return jsonify({'message': 'This request is for a different book'}), 400
+
     # Проверяем существование книги
     book = Book.query.get(book_id)
     if not book:
@@ -388,6 +738,17 @@ def return_book():
     if existing_return:
         return jsonify({'message': 'Book has already been returned'}), 409
 
+    # Ожидающая заявка просто отзывается: книга остаётся у текущего владельца
+    if req.status is None:
+        req.status = False
+        bump_stat('book_pending', book.id, -1)
+        db.session.commit()
+        return jsonify({'message': 'Request withdrawn'}), 200
+
+    # Отклонённую заявку вернуть нельзя - книга по ней не выдавалась
+    if req.status is False:
+        return jsonify({'message': 'The book was not issued on this request'}), 409
+
     # Создаём запись о возврате книги
     new_return = BookReturn(
         request_id=request_id,
@@ -397,13 +758,28 @@ def return_book():
     )
     db.session.add(new_return)
 
+    # Обновляем счётчики статистики
+    bump_stat('user_loans', req.user_id, -1)
+    if not book.isFree:
+        bump_stat('library', 'free', 1)
+        bump_stat('library', 'loaned', -1)
+
     # Обновляем статус заявки и книги
     req.status = False  # Заявка считается завершённой
     book.isFree = True  # Книга становится доступной для новых заявок
 
+    # Выдаём книгу следующему в очереди
+    promoted_request = promote_next_in_line(book)
+
     db.session.commit()
 
-    return jsonify({'message': 'Book return processed successfully'}), 201
+    if promoted_request:
+        notify_promotion(promoted_request)
+
+    return jsonify({
+        'message': 'Book return processed successfully',
+        'promoted_request_id': promoted_request.id if promoted_request else None
+    }), 201
 
 @app.route('/update_return_status', methods=['PUT'])
 def update_return_status():
@@ -429,27 +805,54 @@ def update_return_status():
         return jsonify({'message': 'The book is already marked as free'}), 400
 
 
-    if is_returned:  # Если is_returned == False
-        if not book.isFree:  # Если книга занята (isFree == False)
-            # Обновляем статус возврата и книги
-            book_return.is_returned = True
+    already_returned = book_return.is_returned
+    if not already_returned:
+        # Подтверждаем возврат. Книгу освобождаем, только если она не выдана
+        # по другой заявке (return_book уже мог выдать её следующему в очереди)
+        book_return.is_returned = True
+        if not book.isFree and not current_holder(book.id):
             book.isFree = True
-        else:  # Если книга уже свободна (isFree == True)
-            return jsonify({'message': 'No changes needed, book is already returned'}), 200
+            bump_stat('library', 'free', 1)
+            bump_stat('library', 'loaned', -1)
 
+    # Выдаём свободную книгу следующему в очереди
+    promoted_request = promote_next_in_line(book) if book.isFree else None
+
+    if already_returned and not promoted_request:
+        return jsonify({'message': 'No changes needed, book is already returned'}), 200
 
     # Сохраняем изменения в базе данных
     db.session.commit()
 
+    if promoted_request:
+        notify_promotion(promoted_request)
+
     return jsonify({
         'message': 'Return status updated successfully',
         'return_id': book_return.id,
         'is_returned': book_return.is_returned,
         'book_id': book.id,
-        'book_isFree': book.isFree
+        'book_isFree': book.isFree,
+        'promoted_request_id': promoted_request.id if promoted_request else None
     }), 200
 
 
+# Эндпоинт: статистика библиотеки (из инкрементальных счётчиков)
+@app.route('/stats', methods=['GET'])
+def get_stats():
+    library = stat_values('library')
+    top_limit = app.config['STATS_TOP_LIMIT']
+
+    return jsonify({
+        'books': {
+            'free': library.get('free', 0),
+            'loaned': library.get('loaned', 0)
+        },
+        'pending_requests': stat_values('book_pending'),
+        'top_books': [{'book_id': int(key), 'requests': value} for key, value in stat_top('book_requests', top_limit)],
+        'top_authors': [{'author': key, 'requests': value} for key, value in stat_top('author_requests', top_limit)],
+        'active_loans': stat_values('user_loans')
+    }), 200
 
 
 @app.route('/search_books', methods=['GET'])
@@ -459,7 +862,7 @@ def search_books():
         return jsonify([]), 200  # Возвращаем пустой список, если нет запроса
 
     # Загружаем все книги из базы
-    all_books = Book.query.all()
+    all_books = BOOK_ROWS.fetch()
 
     # Создаём регулярное выражение для поиска
     pattern = re.compile(re.escape(query), re.IGNORECASE)
@@ -471,7 +874,36 @@ def search_books():
     ]
 
     # Возвращаем найденные книги
-    return jsonify([book.to_dict() for book in matched_books]), 200
+    return BOOK_ROWS.response(matched_books)
+
+
+# Эндпоинт: обложка книги из локального кэша
+@app.route('/book_cover/<int:book_id>', methods=['GET'])
+def get_book_cover(book_id):
+    if not app.config['IMAGE_PROXY_ENABLED']:
+        return jsonify({'message': 'Image proxy is disabled'}), 404
+
+    book = Book.query.get(book_id)
+    if not book or not book.image_url:
+        return jsonify({'message': 'Book not found'}), 404
+
+    try:
+        image_file, meta = get_image_cache().open_file(book.image_url)
+    except (OSError, ValueError):
+        return jsonify({'message': 'Image is unavailable'}), 502
+
+    # send_file отдаёт файл через wsgi.file_wrapper (sendfile) и обрабатывает If-None-Match/If-Modified-Since
+    return send_file(
+        image_file,
+        mimetype=meta['content_type'],
+        etag=meta['etag'],
+        last_modified=meta['stored_at'],
+        max_age=app.config['IMAGE_CACHE_REVALIDATE']
+    )
+
+
 # Запуск приложения
 if __name__ == '__main__':
+    init_db()
+    start_background_jobs()
     app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
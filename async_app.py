@@ -0,0 +1,104 @@
+from contextlib import asynccontextmanager
+import re
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+import uvicorn
+
+from app import app as flask_app, db, Book, Request, User, BOOK_ROWS, REQUEST_ROWS, USER_REQUEST_ROWS
+
+
+# ASGI-приложение с read-only эндпоинтами каталога и заявок.
+# Запускается отдельно от Flask-приложения (порт 5001) и использует те же модели и сериализаторы.
+# Импорт app не изменяет базу: её инициализирует app.init_db() при запуске Flask-приложения.
+
+# Один долгоживущий движок с пулом соединений на весь процесс
+# (для aiosqlite по умолчанию используется NullPool - новое соединение на каждый запрос)
+with flask_app.app_context():
+    engine = create_async_engine(
+        db.engine.url.set(drivername='sqlite+aiosqlite'),
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=flask_app.config['ASYNC_POOL_SIZE'],
+        max_overflow=flask_app.config['ASYNC_MAX_OVERFLOW']
+    )
+
+
+# Выполнение read-only запроса через асинхронную сессию
+async def fetch(stmt):
+    async with AsyncSession(engine) as session:
+        return (await session.execute(stmt)).all()
+
+
+def rows_response(serializer, rows):
+    return Response(serializer.encode(rows), media_type='application/json')
+
+
+# Эндпоинт: получение списка всех книг
+async def get_books(request):
+    return rows_response(BOOK_ROWS, await fetch(BOOK_ROWS.select()))
+
+
+async def search_books(request):
+    query = request.query_params.get('query', '').strip().lower()
+    if not query:
+        return JSONResponse([])
+
+    rows = await fetch(BOOK_ROWS.select())
+    pattern = re.compile(re.escape(query), re.IGNORECASE)
+    matched_books = [
+        book for book in rows
+        if pattern.search(f"{book.title.lower()} {book.author.lower()}") is not None
+    ]
+    return rows_response(BOOK_ROWS, matched_books)
+
+
+# Эндпоинт: получить название книги по id
+async def get_book_title(request):
+    rows = await fetch(select(Book.title).where(Book.id == request.path_params['book_id']))
+    if not rows:
+        return JSONResponse({'message': 'Book not found'}, status_code=404)
+    return JSONResponse({'title': rows[0].title})
+
+
+async def get_requests(request):
+    return rows_response(REQUEST_ROWS, await fetch(REQUEST_ROWS.select()))
+
+
+async def get_user_requests_by_id(request):
+    user_id = request.path_params['user_id']
+    if not await fetch(select(User.id).where(User.id == user_id)):
+        return JSONResponse({'message': 'User not found'}, status_code=404)
+
+    rows = await fetch(
+        USER_REQUEST_ROWS.select()
+        .outerjoin(Book, Book.id == Request.book_id)
+        .where(Request.user_id == user_id)
+    )
+    return rows_response(USER_REQUEST_ROWS, rows)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    await engine.dispose()
+
+
+app = Starlette(
+    routes=[
+        Route('/books', get_books),
+        Route('/search_books', search_books),
+        Route('/book_title/{book_id:int}', get_book_title),
+        Route('/requests', get_requests),
+        Route('/user_requests_by_id/{user_id:int}', get_user_requests_by_id),
+    ],
+    lifespan=lifespan
+)
+
+
+# Запуск приложения
+if __name__ == '__main__':
+    uvicorn.run(app, host='0.0.0.0', port=5001)
@@ -0,0 +1,125 @@
+"""Нагрузочное сравнение read-only эндпоинтов: Flask (app.py) против ASGI (async_app.py).
+
+Оба сервера запускаются в отдельных процессах на свободных портах, затем
+заданное число клиентов одновременно открывает соединения и выполняет запросы.
+Для каждого уровня конкурентности печатается пропускная способность,
+медиана и 99-й перцентиль задержки и число ошибок.
+
+    python benchmarks/bench_read_path.py --path /book_title/1 --clients 1 10 100 1000
+"""
+import argparse
+import asyncio
+import os
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = {
+    'sync': "import app; app.app.run(host='127.0.0.1', port={port}, threaded=True)",
+    'async': "import uvicorn, async_app; uvicorn.run(async_app.app, host='127.0.0.1', port={port}, "
+             "log_level='warning', backlog=4096)",
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(kind, port):
+    process = subprocess.Popen(
+        [sys.executable, '-c', SERVERS[kind].format(port=port)],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f'{kind} server did not start')
+
+
+async def fetch(port, path):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n'.encode())
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    if not response.startswith(b'HTTP/1.1 200') and not response.startswith(b'HTTP/1.0 200'):
+        raise RuntimeError(response[:40])
+
+
+async def client(port, path, count, latencies, errors):
+    for _ in range(count):
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(fetch(port, path), timeout=60)
+        except Exception:
+            errors.append(1)
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+async def run_level(port, path, clients, requests_per_client):
+    latencies, errors = [], []
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        client(port, path, requests_per_client, latencies, errors) for _ in range(clients)
+    ))
+    elapsed = time.perf_counter() - started
+    return latencies, errors, elapsed
+
+
+def report(kind, clients, latencies, errors, elapsed):
+    if latencies:
+        latencies.sort()
+        p50 = statistics.median(latencies) * 1000
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    else:
+        p50 = p99 = float('nan')
+    print(f'{kind:>5} {clients:>6} {len(latencies) / elapsed:>10.0f} {p50:>10.1f} {p99:>10.1f} {len(errors):>7}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--path', default='/book_title/1')
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 10, 100, 1000])
+    parser.add_argument('--requests-per-client', type=int, default=5)
+    parser.add_argument('--servers', nargs='+', default=['sync', 'async'], choices=sorted(SERVERS))
+    args = parser.parse_args()
+
+    # 1000 одновременных соединений требуют больше открытых файлов, чем по умолчанию
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    # Серверы только читают базу, поэтому инициализируем её один раз заранее
+    subprocess.run([sys.executable, '-c', 'import app; app.init_db()'], cwd=ROOT, check=True,
+                   stdout=subprocess.DEVNULL)
+
+    print(f'path={args.path} requests_per_client={args.requests_per_client}')
+    print(f'{"kind":>5} {"conc":>6} {"req/s":>10} {"p50 ms":>10} {"p99 ms":>10} {"errors":>7}')
+    for kind in args.servers:
+        port = free_port()
+        process = start_server(kind, port)
+        try:
+            asyncio.run(run_level(port, args.path, 10, 2))  # Прогрев
+            for clients in args.clients:
+                report(kind, clients, *asyncio.run(
+                    run_level(port, args.path, clients, args.requests_per_client)
+                ))
+        finally:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
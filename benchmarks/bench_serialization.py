@@ -0,0 +1,58 @@
+"""Микробенчмарк сериализации списка книг: ORM + to_dict() + json против RowSerializer.
+
+Печатает стоимость одной строки (мкс) для полного пути "запрос + сериализация"
+и отдельно для кодирования уже загруженных данных. Каждый замер берётся
+как минимум из нескольких повторов; перед каждым ORM-запросом сессия
+очищается, как в новом HTTP-запросе.
+
+    python benchmarks/bench_serialization.py --repeat 20
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)  # load_books_from_json читает books.json из текущего каталога
+
+import app as library  # noqa: E402
+
+
+def to_dict_json():
+    library.db.session.expunge_all()
+    return json.dumps([book.to_dict() for book in library.Book.query.all()])
+
+
+def row_serializer():
+    return library.BOOK_ROWS.encode(library.BOOK_ROWS.fetch())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    library.init_db()
+    with library.app.app_context():
+        library.db.session.expunge_all()
+        books = library.Book.query.all()
+        rows = library.BOOK_ROWS.fetch()
+
+        cases = [
+            ('to_dict() + json, query + encode', to_dict_json),
+            ('RowSerializer, query + encode', row_serializer),
+            ('to_dict() + json, encode only', lambda: json.dumps([book.to_dict() for book in books])),
+            ('RowSerializer, encode only', lambda: library.BOOK_ROWS.encode(rows)),
+        ]
+
+        print(f'rows={len(rows)} repeat={args.repeat}')
+        print(f'{"case":<36} {"us/row":>8}')
+        for name, case in cases:
+            best = min(timeit.repeat(case, number=1, repeat=args.repeat))
+            print(f'{name:<36} {best / len(rows) * 1e6:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+from collections import OrderedDict
+from urllib.error import HTTPError
+import hashlib
+import os
+import threading
+import time
+import urllib.request
+
+import orjson
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+# Кэш обложек на диске, ключ - URL. Порядок LRU и общий размер ведутся в памяти,
+# каталог сканируется один раз при создании (порядок - по mtime файлов)
+class ImageCache:
+    def __init__(self, directory, max_bytes, max_file_bytes, revalidate_after, timeout):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.revalidate_after = revalidate_after
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # Путь файла -> размер, от давно не использованных к недавним
+        self.total = 0
+        os.makedirs(directory, exist_ok=True)
+        self.load_entries()
+
+    def load_entries(self):
+        found = []
+        for entry in os.scandir(self.directory):
+            if '.' in entry.name:
+                continue
+            stat = entry.stat()
+            found.append((stat.st_mtime, entry.path, stat.st_size))
+        for _, path, size in sorted(found):
+            self.entries[path] = size
+            self.total += size
+
+    def paths(self, url):
+        name = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        path = os.path.join(self.directory, name)
+        return path, path + '.json'
+
+    def read_meta(self, meta_path):
+        try:
+            with open(meta_path, 'rb') as f:
+                return orjson.loads(f.read())
+        except FileNotFoundError:
+            return None
+
+    # Возвращает путь к файлу и метаданные, при необходимости загружая или перепроверяя обложку
+    def get(self, url):
+        path, meta_path = self.paths(url)
+        meta = self.read_meta(meta_path) if os.path.exists(path) else None
+
+        if not meta or time.time() - meta['checked_at'] >= self.revalidate_after:
+            try:
+                meta = self.fetch(url, path, meta_path, meta)
+            except (OSError, ValueError):
+                if not meta:
+                    raise
+                # Источник недоступен или отдал слишком большой файл - отдаём устаревшую копию
+
+        try:
+            os.utime(path)  # mtime сохраняет порядок LRU между перезапусками
+        except FileNotFoundError:
+            # Файл вытеснен параллельным record() - загружаем заново
+            meta = self.fetch(url, path, meta_path, None)
+        self.touch(path)
+        return path, meta
+
+    # Возвращает открытый файл обложки и метаданные. Открытый файл не пострадает
+    # от последующего вытеснения, а если файл удалён до открытия - загружаем его заново
+    def open_file(self, url):
+        path, meta = self.get(url)
+        try:
+            return open(path, 'rb'), meta
+        except FileNotFoundError:
+            path, meta_path = self.paths(url)
+            meta = self.fetch(url, path, meta_path, None)
+            return open(path, 'rb'), meta
+
+    def fetch(self, url, path, meta_path, meta):
+        headers = {'User-Agent': 'elibrary-image-proxy'}
+        if meta:
+            if meta.get('upstream_etag'):
+                headers['If-None-Match'] = meta['upstream_etag']
+            if meta.get('upstream_last_modified'):
+                headers['If-Modified-Since'] = meta['upstream_last_modified']
+
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=self.timeout) as response:
+                upstream_headers = response.headers
+                length = upstream_headers.get('Content-Length')
+                if length and int(length) > self.max_file_bytes:
+                    raise ValueError(f'Image is larger than {self.max_file_bytes} bytes')
+
+                # Пишем ответ во временный файл по частям, не держа его целиком в памяти
+                digest = hashlib.sha256()
+                size = 0
+                with open(tmp_path, 'wb') as f:
+                    while True:
+                        chunk = response.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        size += len(chunk)
+                        if size > self.max_file_bytes:
+                            raise ValueError(f'Image is larger than {self.max_file_bytes} bytes')
+                        digest.update(chunk)
+                        f.write(chunk)
+        except HTTPError as error:
+            if error.code != 304 or not meta:
+                raise
+            meta['checked_at'] = time.time()
+            self.write_meta(meta_path, meta)
+            return meta
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        meta = {
+            'url': url,
+            'etag': digest.hexdigest(),
+            'content_type': upstream_headers.get_content_type(),
+            'upstream_etag': upstream_headers.get('ETag'),
+            'upstream_last_modified': upstream_headers.get('Last-Modified'),
+            'stored_at': time.time(),
+            'checked_at': time.time()
+        }
+        os.replace(tmp_path, path)
+        self.write_meta(meta_path, meta)
+        self.record(path, size)
+        return meta
+
+    def write_meta(self, meta_path, meta):
+        tmp_path = f'{meta_path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(orjson.dumps(meta))
+        os.replace(tmp_path, meta_path)
+
+    def touch(self, path):
+        with self.lock:
+            if path in self.entries:
+                self.entries.move_to_end(path)
+
+    # Учитывает сохранённый файл и вытесняет давно не использованные, пока кэш больше max_bytes
+    def record(self, path, size):
+        with self.lock:
+            self.total -= self.entries.pop(path, 0)
+            self.entries[path] = size
+            self.total += size
+            # Только что сохранённый файл (последний в порядке) не вытесняется
+            while self.total > self.max_bytes and len(self.entries) > 1:
+                stale_path, stale_size = self.entries.popitem(last=False)
+                for file_path in (stale_path, stale_path + '.json'):
+                    try:
+                        os.remove(file_path)
+                    except FileNotFoundError:
+                        pass
+                self.total -= stale_size
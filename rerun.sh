@@ -7,5 +7,5 @@ docker image rm -f api:latest
 echo "Создание нового образа"
 docker build -t api:latest .
 echo "Запуск контейнера из нового образа"
-docker run --name api -d -p 5000:5000 api:latest
+docker run --name api -d -p 5000:5000 -p 5001:5001 api:latest
 echo "Deploy завершён"
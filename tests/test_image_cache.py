@@ -0,0 +1,204 @@
+import http.server
+import os
+import threading
+
+import pytest
+
+from image_cache import ImageCache
+
+
+# Локальная замена CDN: отдаёт IMAGES по пути, поддерживает If-None-Match
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        server.hits.append((self.path, self.headers.get('If-None-Match')))
+        if self.path not in server.images:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        body = server.images[self.path]
+        etag = f'"{len(body)}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('ETag', etag)
+        if not server.chunked:
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def upstream():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    server.images = {}
+    server.hits = []
+    server.chunked = False
+    server.base_url = f'http://127.0.0.1:{server.server_port}'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_cache(tmp_path, max_bytes=10_000, max_file_bytes=1_000, revalidate_after=3600):
+    return ImageCache(str(tmp_path / 'cache'), max_bytes, max_file_bytes, revalidate_after, timeout=5)
+
+
+def cached_files(cache):
+    return sorted(name for name in os.listdir(cache.directory) if '.' not in name)
+
+
+def test_fetches_once_and_serves_from_disk(tmp_path, upstream):
+    upstream.images['/a.jpg'] = b'a' * 100
+    cache = make_cache(tmp_path)
+    url = upstream.base_url + '/a.jpg'
+
+    path, meta = cache.get(url)
+    cache.get(url)
+
+    with open(path, 'rb') as f:
+        assert f.read() == b'a' * 100
+    assert meta['content_type'] == 'image/jpeg'
+    assert len(upstream.hits) == 1
+
+
+def test_revalidates_stale_entry_with_upstream_etag(tmp_path, upstream):
+    upstream.images['/a.jpg'] = b'a' * 100
+    cache = make_cache(tmp_path, revalidate_after=0)
+    url = upstream.base_url + '/a.jpg'
+
+    _, first = cache.get(url)
+    path, second = cache.get(url)
+
+    assert upstream.hits[1] == ('/a.jpg', '"100"')
+    assert second['etag'] == first['etag']
+    assert second['stored_at'] == first['stored_at']
+    with open(path, 'rb') as f:
+        assert f.read() == b'a' * 100
+
+
+def test_serves_stale_copy_when_upstream_is_down(tmp_path, upstream):
+    upstream.images['/a.jpg'] = b'a' * 100
+    cache = make_cache(tmp_path, revalidate_after=0)
+    url = upstream.base_url + '/a.jpg'
+    cache.get(url)
+
+    upstream.shutdown()
+    upstream.server_close()
+
+    path, meta = cache.get(url)
+    with open(path, 'rb') as f:
+        assert f.read() == b'a' * 100
+
+
+def test_raises_when_upstream_is_down_and_nothing_is_cached(tmp_path, upstream):
+    cache = make_cache(tmp_path)
+    with pytest.raises(OSError):
+        cache.get(upstream.base_url + '/missing.jpg')
+
+
+def test_evicts_least_recently_used_files(tmp_path, upstream):
+    for name in ('a', 'b', 'c'):
+        upstream.images[f'/{name}.jpg'] = name.encode() * 100
+    cache = make_cache(tmp_path, max_bytes=250)
+    urls = {name: f'{upstream.base_url}/{name}.jpg' for name in ('a', 'b', 'c')}
+
+    cache.get(urls['a'])
+    cache.get(urls['b'])
+    cache.get(urls['a'])  # a использовалась позже b
+    cache.get(urls['c'])
+
+    assert cached_files(cache) == sorted(
+        os.path.basename(cache.paths(urls[name])[0]) for name in ('a', 'c')
+    )
+    assert not os.path.exists(cache.paths(urls['b'])[1])
+    assert cache.total == 200
+
+
+def test_fetches_do_not_rescan_cache_directory(tmp_path, upstream, monkeypatch):
+    for i in range(20):
+        upstream.images[f'/{i}.jpg'] = b'x' * 100
+    cache = make_cache(tmp_path, max_bytes=1_000)
+
+    scans = []
+    real_scandir = os.scandir
+    monkeypatch.setattr(os, 'scandir', lambda *args: scans.append(args) or real_scandir(*args))
+    for i in range(20):
+        cache.get(f'{upstream.base_url}/{i}.jpg')
+
+    assert scans == []
+    assert cache.total == 1_000
+    assert len(cached_files(cache)) == 10
+
+
+def test_new_instance_restores_lru_order_from_disk(tmp_path, upstream):
+    for name in ('a', 'b', 'c'):
+        upstream.images[f'/{name}.jpg'] = name.encode() * 100
+    urls = {name: f'{upstream.base_url}/{name}.jpg' for name in ('a', 'b', 'c')}
+    first = make_cache(tmp_path)
+    first.get(urls['a'])
+    first.get(urls['b'])
+    os.utime(first.paths(urls['a'])[0], (1, 1))
+    os.utime(first.paths(urls['b'])[0], (2, 2))
+
+    cache = make_cache(tmp_path, max_bytes=250)
+    assert cache.total == 200
+    cache.get(urls['c'])
+
+    assert not os.path.exists(cache.paths(urls['a'])[0])
+    assert os.path.exists(cache.paths(urls['b'])[0])
+
+
+def test_serves_stale_copy_when_upstream_image_grew_too_large(tmp_path, upstream):
+    upstream.images['/a.jpg'] = b'a' * 100
+    cache = make_cache(tmp_path, revalidate_after=0, max_file_bytes=1_000)
+    url = upstream.base_url + '/a.jpg'
+    cache.get(url)
+
+    upstream.images['/a.jpg'] = b'a' * 5_000
+    path, _ = cache.get(url)
+
+    with open(path, 'rb') as f:
+        assert f.read() == b'a' * 100
+
+
+@pytest.mark.parametrize('chunked', [False, True])
+def test_rejects_oversized_image(tmp_path, upstream, chunked):
+    upstream.images['/big.jpg'] = b'x' * 5_000
+    upstream.chunked = chunked
+    cache = make_cache(tmp_path, max_file_bytes=1_000)
+
+    with pytest.raises(ValueError):
+        cache.get(upstream.base_url + '/big.jpg')
+    assert os.listdir(cache.directory) == []
+
+
+def test_refetches_file_evicted_before_open(tmp_path, upstream, monkeypatch):
+    upstream.images['/a.jpg'] = b'a' * 100
+    cache = make_cache(tmp_path)
+    url = upstream.base_url + '/a.jpg'
+
+    # Файл вытесняется между get() и открытием
+    original_get = cache.get
+
+    def get_then_evict(url):
+        path, meta = original_get(url)
+        os.remove(path)
+        return path, meta
+
+    monkeypatch.setattr(cache, 'get', get_then_evict)
+
+    image_file, meta = cache.open_file(url)
+    with image_file:
+        assert image_file.read() == b'a' * 100
+    assert len(upstream.hits) == 2
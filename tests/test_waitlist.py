@@ -0,0 +1,153 @@
+import pytest
+from werkzeug.security import generate_password_hash
+
+from app import app, db, socketio, init_admin_user, reconcile_stats, Book, Request, User
+
+
+@pytest.fixture
+def client():
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        init_admin_user()
+        for username in ('u1', 'u2', 'u3'):
+            db.session.add(User(username=username, password=generate_password_hash('p')))
+        db.session.add(Book(title='Книга', author='Автор', holders=[], isFree=True))
+        db.session.commit()
+        reconcile_stats()
+    return app.test_client()
+
+
+def user_id(username):
+    with app.app_context():
+        return User.query.filter_by(username=username).first().id
+
+
+def create_request(client, username):
+    response = client.post('/create_request', json={'userId': user_id(username), 'bookId': 1})
+    return response.get_json()['request_id']
+
+
+def approve(client, request_id):
+    return client.post('/update_request_status', json={'requestId': request_id, 'status': True})
+
+
+def return_book(client, request_id, username, book_id=1):
+    return client.post('/return_book', json={
+        'request_id': request_id, 'user_id': user_id(username), 'book_id': book_id
+    })
+
+
+def statuses():
+    with app.app_context():
+        return {req.id: req.status for req in Request.query.all()}
+
+
+def book_is_free():
+    with app.app_context():
+        return db.session.get(Book, 1).isFree
+
+
+# u1 держит книгу, u2 и u3 ждут в очереди (в этом порядке)
+@pytest.fixture
+def loaned(client):
+    holder = create_request(client, 'u1')
+    assert approve(client, holder).status_code == 200
+    first = create_request(client, 'u2')
+    second = create_request(client, 'u3')
+    return holder, first, second
+
+
+def test_waiters_get_fifo_positions(client, loaned):
+    _, first, second = loaned
+
+    assert approve(client, second).get_json()['waitlist_position'] == 2
+    assert approve(client, first).get_json()['waitlist_position'] == 1
+    assert statuses()[first] is None and statuses()[second] is None
+
+
+def test_returning_holder_promotes_oldest_waiter(client, loaned):
+    holder, first, second = loaned
+    listeners = {
+        name: socketio.test_client(app, auth={'username': name, 'password': password})
+        for name, password in (('u2', 'p'), ('u3', 'p'), ('admin', 'qwerty'))
+    }
+
+    response = return_book(client, holder, 'u1')
+
+    assert response.status_code == 201
+    assert response.get_json()['promoted_request_id'] == first
+    assert statuses() == {holder: False, first: True, second: None}
+    assert not book_is_free()
+
+    def promoted(name):
+        return [event for event in listeners[name].get_received() if event['name'] == 'request_promoted']
+
+    assert promoted('u2')[0]['args'][0]['id'] == first
+    assert promoted('admin')[0]['args'][0]['id'] == first
+    assert promoted('u3') == []
+
+
+def test_withdrawing_pending_request_promotes_no_one(client, loaned):
+    holder, first, second = loaned
+
+    response = return_book(client, second, 'u3')
+
+    assert response.status_code == 200
+    assert response.get_json()['message'] == 'Request withdrawn'
+    assert statuses() == {holder: True, first: None, second: False}
+    assert not book_is_free()
+    assert client.get('/returns').get_json() == []
+    assert client.get('/stats').get_json()['pending_requests'] == {'1': 1}
+
+
+def test_return_with_mismatched_book_is_rejected(client, loaned):
+    holder, _, _ = loaned
+    with app.app_context():
+        db.session.add(Book(title='Другая', author='Автор', holders=[], isFree=True))
+        db.session.commit()
+
+    assert return_book(client, holder, 'u1', book_id=2).status_code == 400
+    assert statuses()[holder] is True
+
+
+def test_confirming_return_after_promotion_keeps_book_loaned(client, loaned):
+    holder, first, second = loaned
+    return_book(client, holder, 'u1')
+    return_id = client.get('/returns').get_json()[0]['id']
+
+    response = client.put('/update_return_status', json={'return_id': return_id, 'is_returned': True})
+
+    body = response.get_json()
+    assert body['is_returned'] is True
+    assert body['book_isFree'] is False
+    assert body['promoted_request_id'] is None
+    assert statuses() == {holder: False, first: True, second: None}
+
+
+def test_confirming_return_promotes_waiter_on_free_book(client):
+    holder = create_request(client, 'u1')
+    approve(client, holder)
+    return_book(client, holder, 'u1')
+    assert book_is_free()
+    waiter = create_request(client, 'u2')
+    return_id = client.get('/returns').get_json()[0]['id']
+
+    response = client.put('/update_return_status', json={'return_id': return_id, 'is_returned': True})
+
+    assert response.get_json()['promoted_request_id'] == waiter
+    assert statuses()[waiter] is True
+    assert not book_is_free()
+
+
+def test_counters_match_reconcile_after_waitlist_flow(client, loaned):
+    holder, first, second = loaned
+    return_book(client, second, 'u3')
+    return_book(client, holder, 'u1')
+    return_id = client.get('/returns').get_json()[0]['id']
+    client.put('/update_return_status', json={'return_id': return_id, 'is_returned': True})
+
+    incremental = client.get('/stats').get_json()
+    with app.app_context():
+        reconcile_stats()
+    assert client.get('/stats').get_json() == incremental